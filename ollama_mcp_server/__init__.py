@@ -4,8 +4,6 @@ __version__ = "0.2.0"
 __author__ = "Claude Code"
 __license__ = "MIT"
 
-from .main import mcp
-from .config import settings
 from .client import OllamaClient, OllamaError, OllamaConnectionError, OllamaAPIError
 
 __all__ = [
@@ -15,4 +13,16 @@ __all__ = [
     "OllamaError",
     "OllamaConnectionError",
     "OllamaAPIError",
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name: str):
+    # Load the server and settings on first access, so importing a
+    # submodule does not read the environment or .env
+    if name == "mcp":
+        from .main import mcp
+        return mcp
+    if name == "settings":
+        from .config import get_settings
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
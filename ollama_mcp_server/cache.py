@@ -1,99 +1,174 @@
 """Simple in-memory cache for Ollama MCP Server"""
+import random
 import time
-from typing import Dict, Any, Optional, Tuple
-from functools import wraps
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from functools import partial, wraps
 import asyncio
 import logging
 
-from .config import settings
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
+_random = random.Random()
+
 
 class SimpleCache:
-    """Simple TTL-based in-memory cache"""
+    """Simple TTL-based in-memory cache with LRU eviction"""
+    
+    __slots__ = ("_cache", "_maxsize", "_inflight")
     
-    def __init__(self):
-        self._cache: Dict[str, Tuple[Any, float]] = {}
-        self._lock = asyncio.Lock()
+    def __init__(self, maxsize: Optional[int] = None):
+        self._cache: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        # None means use settings.cache_maxsize, read when entries are added
+        self._maxsize = maxsize
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
         
-    async def get(self, key: str) -> Optional[Any]:
+    async def get(self, key: Hashable) -> Optional[Any]:
         """Get value from cache if not expired"""
-        async with self._lock:
-            if key not in self._cache:
-                return None
-                
-            value, expiry = self._cache[key]
-            if time.time() > expiry:
-                del self._cache[key]
-                return None
-                
-            return value
+        # Single dict operations never yield to the event loop, so no
+        # lock is needed
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+            
+        value, expiry = entry
+        if time.monotonic() > expiry:
+            self._cache.pop(key, None)
+            return None
             
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        forget_prob = get_settings().cache_forget_prob
+        if forget_prob and _random.random() < forget_prob:
+            # Randomly drop hits so a stale entry heals before its TTL ends
+            self._cache.pop(key, None)
+        else:
+            self._cache.move_to_end(key)
+        return value
+            
+    async def set(self, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
         """Set value in cache with TTL"""
+        settings = get_settings()
         if ttl is None:
             ttl = settings.cache_ttl
+        maxsize = self._maxsize if self._maxsize is not None else settings.cache_maxsize
             
-        async with self._lock:
-            expiry = time.time() + ttl
-            self._cache[key] = (value, expiry)
+        self._sweep_expired()
+        self._cache[key] = (value, time.monotonic() + ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > maxsize:
+            self._cache.popitem(last=False)
             
-    async def delete(self, key: str) -> None:
+    def _sweep_expired(self, limit: int = 16) -> None:
+        """Evict up to limit expired entries from the LRU end of the cache
+
+        Stops at the first live entry, so the cost per call stays bounded.
+        """
+        now = time.monotonic()
+        for _ in range(min(limit, len(self._cache))):
+            _, (_, expiry) = next(iter(self._cache.items()))
+            if now <= expiry:
+                break
+            self._cache.popitem(last=False)
+            
+    async def get_or_set(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None
+    ) -> Any:
+        """Get value from cache, or await factory() and cache its result
+
+        Concurrent misses for the same key share a single factory() call;
+        its result or exception is delivered to every waiter.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+            
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, factory, ttl))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._fill_done, key))
+        else:
+            logger.debug(f"Waiting on in-flight call for {key}")
+            
+        # The shared call runs in its own task and is shielded, so a
+        # cancelled caller never cancels it for the others
+        return await asyncio.shield(task)
+        
+    async def _fill(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        ttl: Optional[int]
+    ) -> Any:
+        """Await factory() and cache its result"""
+        value = await factory()
+        await self.set(key, value, ttl)
+        return value
+        
+    def _fill_done(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        """Forget a finished in-flight call"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller went away
+            task.exception()
+            
+    async def delete(self, key: Hashable) -> None:
         """Delete key from cache"""
-        async with self._lock:
-            if key in self._cache:
-                del self._cache[key]
+        self._cache.pop(key, None)
                 
     async def clear(self) -> None:
         """Clear all cache entries"""
-        async with self._lock:
-            self._cache.clear()
-            
-    async def cleanup_expired(self) -> None:
-        """Remove expired entries"""
-        async with self._lock:
-            current_time = time.time()
-            expired_keys = [
-                key for key, (_, expiry) in self._cache.items()
-                if current_time > expiry
-            ]
-            for key in expired_keys:
-                del self._cache[key]
-                
-            if expired_keys:
-                logger.debug(f"Cleaned up {len(expired_keys)} expired cache entries")
+        self._cache.clear()
 
 
 # Global cache instance
 cache = SimpleCache()
 
 
+def _make_key(key_prefix: str, func, args: tuple, kwargs: dict) -> Hashable:
+    """Build the cache key for a call to a cached function
+
+    The arguments are kept in the key itself rather than reduced to
+    hash(), so distinct calls whose hashes collide never share an entry.
+    """
+    return (
+        key_prefix,
+        func.__qualname__,
+        args,
+        tuple(sorted(kwargs.items())) if kwargs else (),
+    )
+
+
 def cached(key_prefix: str, ttl: Optional[int] = None):
-    """Decorator for caching async function results"""
+    """Decorator for caching async function results
+
+    When caching is disabled the function is returned unwrapped, so there is
+    no per-call overhead. The decorated function exposes
+    ``cache_invalidate(*args, **kwargs)`` to drop the entry for one call.
+    """
     def decorator(func):
+        if not get_settings().enable_cache:
+            async def cache_invalidate(*args, **kwargs):
+                pass
+            func.cache_invalidate = cache_invalidate
+            return func
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            if not settings.enable_cache:
-                return await func(*args, **kwargs)
-                
-            # Create cache key from function name and arguments
-            cache_key = f"{key_prefix}:{func.__name__}"
-            if args or kwargs:
-                # Simple key generation - can be improved
-                cache_key += f":{hash((args, tuple(sorted(kwargs.items()))))}"
-                
-            # Try to get from cache
-            cached_value = await cache.get(cache_key)
-            if cached_value is not None:
-                logger.debug(f"Cache hit for {cache_key}")
-                return cached_value
-                
-            # Call function and cache result
-            result = await func(*args, **kwargs)
-            await cache.set(cache_key, result, ttl)
-            logger.debug(f"Cached result for {cache_key}")
-            
-            return result
+            cache_key = _make_key(key_prefix, func, args, kwargs)
+            return await cache.get_or_set(
+                cache_key, lambda: func(*args, **kwargs), ttl
+            )
+
+        async def cache_invalidate(*args, **kwargs):
+            """Drop the cached result for the given call arguments"""
+            await cache.delete(_make_key(key_prefix, func, args, kwargs))
+
+        wrapper.cache_invalidate = cache_invalidate
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
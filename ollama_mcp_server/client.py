@@ -1,23 +1,123 @@
 """HTTP client for Ollama API with connection pooling and retry logic"""
 import asyncio
 import logging
-from typing import Dict, Any, Optional, TypeVar, Type
+import random
+from typing import AsyncGenerator, Dict, Any, Optional, TypeVar, Type
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 
 import httpx
+import orjson
 from pydantic import BaseModel
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception_type, stop_after_attempt
 
-from .config import settings
-from .models import ErrorResponse
+from .config import get_settings, detect_ollama_host
+from .models import ErrorResponse, construct_trusted
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar("T", bound=BaseModel)
 
+# Statuses worth retrying: Ollama overloaded, restarting or behind a proxy
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+@lru_cache(maxsize=1)
+def _client_options() -> Dict[str, Any]:
+    """Timeout, pool and protocol options for the httpx client, built once"""
+    settings = get_settings()
+    return {
+        "timeout": httpx.Timeout(
+            connect=settings.connection_timeout,
+            read=settings.request_timeout,
+            write=settings.request_timeout,
+            pool=settings.connection_timeout
+        ),
+        "limits": httpx.Limits(
+            max_keepalive_connections=settings.pool_keepalive,
+            max_connections=settings.pool_size,
+            keepalive_expiry=settings.pool_keepalive_expiry
+        ),
+        "http2": settings.http2
+    }
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff delay with jitter for the given attempt"""
+    # Jitter spreads out clients reconnecting after an Ollama restart
+    return get_settings().retry_delay * (1 << attempt) * (0.5 + random.random())
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Get the delay requested by a Retry-After header, if any
+
+    The delay is capped at the request timeout, so a server asking for
+    hours cannot stall a tool call.
+    """
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            # A "-0000" zone parses as naive; HTTP dates are always UTC
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(0.0, delay), get_settings().request_timeout)
+
+
+def _api_error(response: httpx.Response) -> "OllamaAPIError":
+    """Build an OllamaAPIError, tolerating non-JSON error pages from proxies"""
+    try:
+        error_data = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        error_data = None
+    return OllamaAPIError(
+        f"API error {response.status_code}",
+        status_code=response.status_code,
+        error_response=ErrorResponse(**error_data) if isinstance(error_data, dict) else None
+    )
+
+
+class _RetryableStatusError(Exception):
+    """Raised inside the retry loop for a response worth retrying"""
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Ollama returned {response.status_code}")
+        self.response = response
+
+
+def _retry_wait(retry_state: RetryCallState) -> float:
+    """Honour Retry-After on retryable statuses, otherwise back off"""
+    error = retry_state.outcome.exception()
+    if isinstance(error, _RetryableStatusError):
+        delay = _retry_after(error.response)
+        if delay is not None:
+            return delay
+    return _backoff_delay(retry_state.attempt_number - 1)
+
+
+def _log_retry(retry_state: RetryCallState) -> None:
+    """Log a failed attempt before sleeping for the next one"""
+    logger.warning(
+        f"Request failed: {retry_state.outcome.exception()}. "
+        f"Retrying in {retry_state.next_action.sleep:.2f} seconds..."
+    )
+
 
 class OllamaClient:
     """HTTP client for Ollama API with connection pooling"""
     
+    __slots__ = ("_client", "_is_connected")
+    
     def __init__(self):
         self._client: Optional[httpx.AsyncClient] = None
         self._is_connected = False
@@ -25,19 +125,10 @@ class OllamaClient:
     async def connect(self):
         """Initialize the HTTP client"""
         if self._client is None:
+            settings = get_settings()
             self._client = httpx.AsyncClient(
                 base_url=settings.ollama_host,
-                timeout=httpx.Timeout(
-                    connect=settings.connection_timeout,
-                    read=settings.request_timeout,
-                    write=settings.request_timeout,
-                    pool=settings.connection_timeout
-                ),
-                limits=httpx.Limits(
-                    max_keepalive_connections=5,
-                    max_connections=10,
-                    keepalive_expiry=30
-                )
+                **_client_options()
             )
             logger.info(f"Connected to Ollama at {settings.ollama_host}")
             
@@ -50,7 +141,26 @@ class OllamaClient:
             logger.info("Disconnected from Ollama")
             
     async def health_check(self) -> bool:
-        """Check if Ollama is accessible"""
+        """Check if Ollama is accessible, falling back to host detection"""
+        if await self._ping():
+            return True
+        
+        # Only auto-detect when the host wasn't configured explicitly
+        settings = get_settings()
+        if "ollama_host" in settings.model_fields_set:
+            return False
+        host = await asyncio.to_thread(detect_ollama_host)
+        if host is None or host == settings.ollama_host:
+            return False
+        
+        logger.info(f"Ollama not reachable at {settings.ollama_host}, using {host}")
+        settings.ollama_host = host
+        await self.disconnect()
+        await self.connect()
+        return await self._ping()
+        
+    async def _ping(self) -> bool:
+        """Check if Ollama answers at the configured host"""
         try:
             if not self._client:
                 await self.connect()
@@ -66,83 +176,132 @@ class OllamaClient:
         endpoint: str,
         json_data: Optional[Dict[str, Any]] = None,
         response_model: Optional[Type[T]] = None,
-        stream: bool = False
+        trusted: bool = False
     ) -> Any:
-        """Make HTTP request with retry logic"""
+        """Make HTTP request with retry logic
+        
+        With trusted=True the response is built into response_model without
+        validation; only use it for well-formed responses from Ollama.
+        """
+        settings = get_settings()
         if not self._client:
             await self.connect()
             
         url = endpoint if endpoint.startswith("/") else f"/{endpoint}"
-        retries = 0
+        # Serialize the body once, outside the retry loop
+        content = orjson.dumps(json_data) if json_data is not None else None
+        headers = JSON_HEADERS if content is not None else None
+        log_requests = settings.log_requests and logger.isEnabledFor(logging.DEBUG)
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(settings.max_retries + 1),
+            wait=_retry_wait,
+            retry=retry_if_exception_type((httpx.TransportError, _RetryableStatusError)),
+            before_sleep=_log_retry,
+            reraise=True
+        )
         
-        while retries <= settings.max_retries:
-            try:
-                if settings.log_requests:
-                    logger.debug(f"{method} {url} - Data: {json_data}")
-                
-                if stream:
-                    # Return the stream directly for streaming responses
-                    return await self._client.stream(method, url, json=json_data)
-                
-                response = await self._client.request(method, url, json=json_data)
-                
-                if settings.log_requests:
-                    logger.debug(f"Response {response.status_code}: {response.text[:200]}...")
-                
-                if response.status_code >= 400:
-                    error_data = response.json()
-                    error = ErrorResponse(**error_data) if isinstance(error_data, dict) else None
-                    raise OllamaAPIError(
-                        f"API error {response.status_code}",
-                        status_code=response.status_code,
-                        error_response=error
-                    )
-                
-                data = response.json()
-                
-                if response_model:
-                    return response_model(**data)
-                return data
-                
-            except httpx.ConnectError as e:
-                logger.error(f"Connection error: {e}")
-                raise OllamaConnectionError(
-                    "Cannot connect to Ollama. Is it running? "
-                    f"Check: {settings.ollama_host}"
-                )
-                
-            except httpx.TimeoutException as e:
-                logger.error(f"Request timeout: {e}")
-                if retries < settings.max_retries:
-                    wait_time = settings.retry_delay * (2 ** retries)
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    await asyncio.sleep(wait_time)
-                    retries += 1
-                else:
-                    raise OllamaTimeoutError(f"Request timeout after {settings.max_retries} retries")
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    if log_requests:
+                        logger.debug("%s %s - Data: %s", method, url, json_data)
+                    
+                    response = await self._client.request(method, url, content=content, headers=headers)
                     
-            except Exception as e:
-                if retries < settings.max_retries and not isinstance(e, (OllamaAPIError, OllamaConnectionError)):
-                    wait_time = settings.retry_delay * (2 ** retries)
-                    logger.warning(f"Request failed: {e}. Retrying in {wait_time} seconds...")
-                    await asyncio.sleep(wait_time)
-                    retries += 1
-                else:
-                    raise
+                    if log_requests:
+                        logger.debug("Response %s: %r...", response.status_code, response.content[:200])
                     
-    async def get(self, endpoint: str, response_model: Optional[Type[T]] = None) -> Any:
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        raise _RetryableStatusError(response)
+                    if response.status_code >= 400:
+                        raise _api_error(response)
+                    
+                    if response_model and trusted:
+                        return construct_trusted(response_model, orjson.loads(response.content))
+                    if response_model:
+                        # Parse and validate the raw bytes in one pass in pydantic-core
+                        return response_model.model_validate_json(response.content)
+                    return orjson.loads(response.content)
+                
+        except _RetryableStatusError as e:
+            raise _api_error(e.response)
+            
+        except httpx.ConnectError as e:
+            logger.error(f"Connection error: {e}")
+            raise OllamaConnectionError(
+                "Cannot connect to Ollama. Is it running? "
+                f"Check: {settings.ollama_host}"
+            )
+            
+        except httpx.TimeoutException as e:
+            logger.error(f"Request timeout: {e}")
+            raise OllamaTimeoutError(f"Request timeout after {settings.max_retries} retries")
+                    
+    async def get(
+        self,
+        endpoint: str,
+        response_model: Optional[Type[T]] = None,
+        trusted: bool = False
+    ) -> Any:
         """Make GET request"""
-        return await self._request("GET", endpoint, response_model=response_model)
+        return await self._request("GET", endpoint, response_model=response_model, trusted=trusted)
         
     async def post(
         self,
         endpoint: str,
         json_data: Dict[str, Any],
         response_model: Optional[Type[T]] = None,
-        stream: bool = False
+        trusted: bool = False
     ) -> Any:
         """Make POST request"""
-        return await self._request("POST", endpoint, json_data, response_model, stream)
+        return await self._request("POST", endpoint, json_data, response_model, trusted)
+        
+    async def stream_post(self, endpoint: str, json_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Make streaming POST request, yielding each NDJSON chunk parsed
+        
+        Streams are not retried, since a partially consumed response
+        cannot be replayed.
+        """
+        settings = get_settings()
+        if not self._client:
+            await self.connect()
+            
+        url = endpoint if endpoint.startswith("/") else f"/{endpoint}"
+        
+        try:
+            async with self._client.stream(
+                "POST", url, content=orjson.dumps(json_data), headers=JSON_HEADERS
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise _api_error(response)
+                # Split raw bytes on newlines and hand each line straight to
+                # orjson, skipping the per-line str decode of aiter_lines()
+                buf = bytearray()
+                async for data in response.aiter_bytes():
+                    buf += data
+                    start = 0
+                    while True:
+                        nl = buf.find(b"\n", start)
+                        if nl == -1:
+                            break
+                        if nl > start:
+                            yield orjson.loads(memoryview(buf)[start:nl])
+                        start = nl + 1
+                    del buf[:start]
+                if buf.strip():
+                    yield orjson.loads(buf)
+                        
+        except httpx.ConnectError as e:
+            logger.error(f"Connection error: {e}")
+            raise OllamaConnectionError(
+                "Cannot connect to Ollama. Is it running? "
+                f"Check: {settings.ollama_host}"
+            )
+            
+        except httpx.TimeoutException as e:
+            logger.error(f"Request timeout: {e}")
+            raise OllamaTimeoutError("Streaming request timed out")
         
     async def delete(self, endpoint: str, json_data: Dict[str, Any]) -> Any:
         """Make DELETE request"""
@@ -182,6 +341,8 @@ class OllamaTimeoutError(OllamaError):
 
 class OllamaAPIError(OllamaError):
     """Raised when API returns an error"""
+    __slots__ = ("status_code", "error_response")
+    
     def __init__(self, message: str, status_code: int, error_response: Optional[ErrorResponse] = None):
         super().__init__(message)
         self.status_code = status_code
@@ -1,42 +1,47 @@
 """Configuration management for Ollama MCP Server"""
 import os
 import socket
+from functools import lru_cache
 from typing import Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
 
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+
 def get_default_ollama_host() -> str:
     """
     Get default Ollama host based on environment.
-    Uses localhost for local development, but tries to detect host IP for external access.
+    Uses localhost unless OLLAMA_HOST is set. No network probe is done here;
+    see detect_ollama_host() for the fallback used when localhost fails.
     """
     # If explicitly set via environment, use that
     if "OLLAMA_HOST" in os.environ:
         return os.environ["OLLAMA_HOST"]
-    
-    # Check if we can connect to localhost:11434 first (standard Ollama setup)
+    return DEFAULT_OLLAMA_HOST
+
+
+@lru_cache(maxsize=1)
+def detect_ollama_host() -> Optional[str]:
+    """
+    Find a reachable Ollama on this machine, trying localhost first and then
+    the host's own network address. Blocking; the result is cached.
+    """
+    candidates = ["127.0.0.1"]
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
-        result = sock.connect_ex(('127.0.0.1', 11434))
-        sock.close()
-        if result == 0:
-            return "http://localhost:11434"
-    except:
+        candidates.append(socket.gethostbyname(socket.gethostname()))
+    except OSError:
         pass
     
-    # If localhost doesn't work, try to find the local IP
-    try:
-        # Connect to a remote address to determine local IP
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.connect(("8.8.8.8", 80))
-        local_ip = sock.getsockname()[0]
-        sock.close()
-        return f"http://{local_ip}:11434"
-    except:
-        # Fallback to localhost if all else fails
-        return "http://localhost:11434"
+    for ip in candidates:
+        try:
+            with socket.create_connection((ip, 11434), timeout=1):
+                pass
+        except OSError:
+            continue
+        return DEFAULT_OLLAMA_HOST if ip == "127.0.0.1" else f"http://{ip}:11434"
+    return None
 
 
 class Settings(BaseSettings):
@@ -74,6 +79,40 @@ class Settings(BaseSettings):
         description="Initial retry delay in seconds"
     )
     
+    # Connection pool settings
+    pool_size: int = Field(
+        default=100,
+        ge=1,
+        validation_alias="OLLAMA_POOL_SIZE",
+        description="Maximum number of concurrent connections to Ollama"
+    )
+    
+    pool_keepalive: int = Field(
+        default=40,
+        ge=0,
+        validation_alias="OLLAMA_POOL_KEEPALIVE",
+        description="Maximum number of idle keep-alive connections"
+    )
+    
+    pool_keepalive_expiry: float = Field(
+        default=30.0,
+        validation_alias="OLLAMA_POOL_KEEPALIVE_EXPIRY",
+        description="Idle keep-alive connection expiry in seconds"
+    )
+    
+    http2: bool = Field(
+        default=True,
+        validation_alias="OLLAMA_HTTP2",
+        description="Negotiate HTTP/2 with Ollama when served over https"
+    )
+    
+    embed_concurrency: int = Field(
+        default=8,
+        ge=1,
+        validation_alias="OLLAMA_EMBED_CONCURRENCY",
+        description="Maximum concurrent requests when embedding a list of prompts"
+    )
+    
     # Logging settings
     log_level: str = Field(
         default="INFO",
@@ -100,6 +139,28 @@ class Settings(BaseSettings):
         description="Cache TTL in seconds"
     )
     
+    cache_maxsize: int = Field(
+        default=1024,
+        ge=1,
+        validation_alias="OLLAMA_CACHE_MAXSIZE",
+        description="Maximum number of cached entries before LRU eviction"
+    )
+    
+    completion_cache_ttl: int = Field(
+        default=300,
+        ge=0,
+        validation_alias="OLLAMA_COMPLETION_CACHE_TTL",
+        description="TTL in seconds for cached deterministic completions (0 disables)"
+    )
+    
+    cache_forget_prob: float = Field(
+        default=0.0,
+        ge=0.0,
+        le=1.0,
+        validation_alias="OLLAMA_CACHE_FORGET_PROB",
+        description="Probability of evicting an entry when it is read (0 disables)"
+    )
+    
     @field_validator("ollama_host")
     @classmethod
     def validate_ollama_host(cls, v: str) -> str:
@@ -124,5 +185,21 @@ class Settings(BaseSettings):
         extra = 'ignore'  # Ignore extra fields in environment variables
 
 
-# Global settings instance
-settings = Settings()
\ No newline at end of file
+# Global settings instance, created on first use
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Get the global settings, reading the environment on first call"""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def __getattr__(name: str):
+    # Keep `from .config import settings` working without building
+    # Settings when this module is imported
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
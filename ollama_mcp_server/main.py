@@ -2,19 +2,23 @@
 """
 Ollama MCP Server - Enhanced Bridge between MCP and Ollama API
 """
+import asyncio
+import hashlib
 import logging
 import sys
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Tuple, Union
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from mcp.server.fastmcp import FastMCP
+import orjson
+from mcp.server.fastmcp import Context, FastMCP
 from pydantic import ValidationError
 
 from .config import settings
 from .client import ollama_client, OllamaError, OllamaConnectionError, OllamaAPIError
 from .cache import cache, cached
 from .models import (
-    GenerateOptions, Message, ModelInfo, ModelListResponse,
+    GenerateOptions, ModelInfo, ModelListResponse,
     GenerateResponse, ChatResponse, EmbeddingsResponse,
     ProcessListResponse, ModelDetails
 )
@@ -58,54 +62,154 @@ async def lifespan(server):
 # Create the MCP server with lifespan
 mcp = FastMCP("ollama-mcp-server", lifespan=lifespan)
 
+def connection_error(e: Exception) -> Dict[str, Any]:
+    """Tool result for when Ollama can't be reached"""
+    return {
+        "error": "Cannot connect to Ollama",
+        "details": str(e),
+        # Read per call, since host detection may switch hosts at startup
+        "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
+    }
+
+
+def api_error(e: OllamaAPIError) -> Dict[str, Any]:
+    """Tool result for an error response from Ollama"""
+    return {"error": "Ollama API error", "details": str(e), "status_code": e.status_code}
+
+
+def internal_error(e: Exception) -> Dict[str, Any]:
+    """Tool result for an unexpected error"""
+    return {"error": "Internal server error", "details": str(e)}
+
+
+VALID_ROLES = frozenset(("system", "user", "assistant"))
+
+def message_errors(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Check chat messages, reporting problems like ValidationError.errors()"""
+    errors = []
+    for i, msg in enumerate(messages):
+        if "content" not in msg:
+            errors.append({
+                "type": "missing",
+                "loc": ("messages", i, "content"),
+                "msg": "Field required",
+                "input": msg
+            })
+        if msg.get("role") not in VALID_ROLES:
+            errors.append({
+                "type": "value_error",
+                "loc": ("messages", i, "role"),
+                "msg": "Role must be one of: system, user, assistant",
+                "input": msg.get("role")
+            })
+    return errors
+
+
+MODELS_CACHE_KEY = "models:list_models"
+MODEL_NAMES_CACHE_KEY = "models:name_set"
+
+
+async def invalidate_model_cache() -> None:
+    """Drop cached model listings after models are added or removed"""
+    await cache.delete(MODELS_CACHE_KEY)
+    await cache.delete(MODEL_NAMES_CACHE_KEY)
+
+
+@lru_cache(maxsize=1024)
+def build_options(
+    temperature: Optional[float],
+    top_p: Optional[float],
+    top_k: Optional[int],
+    seed: Optional[int],
+    num_predict: Optional[int],
+    stop: Optional[Tuple[str, ...]]
+) -> Dict[str, Any]:
+    """
+    Validate generation options into the request's options dict. Cached,
+    since callers tend to reuse the same settings; the returned dict is
+    shared and must not be modified. Invalid values raise ValidationError.
+    """
+    return GenerateOptions(
+        temperature=temperature,
+        top_p=top_p,
+        top_k=top_k,
+        seed=seed,
+        num_predict=num_predict,
+        stop=stop
+    ).dict(exclude_none=True)
+
+
+def completion_cache_key(kind: str, request_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Exact-match cache key for a completion request, or None if the request
+    shouldn't be cached. Only deterministic requests are cached: greedy
+    sampling (temperature 0) or a fixed seed.
+    """
+    if not settings.enable_cache or not settings.completion_cache_ttl:
+        return None
+    options = request_data.get("options", {})
+    if options.get("temperature") != 0 and options.get("seed") is None:
+        return None
+    payload = orjson.dumps(request_data, option=orjson.OPT_SORT_KEYS)
+    return f"{kind}:{hashlib.blake2b(payload, digest_size=16).hexdigest()}"
+
+
+async def report_chunk(ctx: Optional[Context], count: int, text: str) -> None:
+    """Forward a streamed chunk to the client as a progress notification
+    
+    This is a no-op unless the client sent a progress token with the request.
+    """
+    if ctx is not None and text:
+        await ctx.report_progress(count, message=text)
+
+
+def project_models(models: List[ModelInfo]) -> List[Dict[str, Any]]:
+    """Project models onto the fields list_models returns"""
+    return [
+        {
+            "name": model.name,
+            "size": model.size,
+            "modified_at": model.modified_at,
+            "digest": model.digest
+        }
+        for model in models
+    ]
+
+
+async def fetch_models() -> Dict[str, Any]:
+    """Fetch the model list from Ollama, caching the model names as well"""
+    response = await ollama_client.get("/api/tags", response_model=ModelListResponse)
+    
+    # Convert to dict for JSON serialization
+    result = {"models": project_models(response.models)}
+    
+    if settings.enable_cache:
+        # Names alone, for check_model_exists membership tests
+        await cache.set(
+            MODEL_NAMES_CACHE_KEY,
+            frozenset(model["name"] for model in result["models"]),
+            300
+        )
+    
+    return result
+
 
 @mcp.tool()
 async def list_models() -> Dict[str, Any]:
     """List all available Ollama models"""
     try:
         logger.debug("Listing models")
-        # Try to get from cache first
         if settings.enable_cache:
-            cache_key = "models:list_models"
-            cached_value = await cache.get(cache_key)
-            if cached_value is not None:
-                logger.debug(f"Cache hit for {cache_key}")
-                return cached_value
-        
-        response = await ollama_client.get("/api/tags", response_model=ModelListResponse)
-        
-        # Convert to dict for JSON serialization
-        result = {
-            "models": [
-                {
-                    "name": model.name,
-                    "size": model.size,
-                    "modified_at": model.modified_at.isoformat() if model.modified_at else None,
-                    "digest": model.digest
-                }
-                for model in response.models
-            ]
-        }
-        
-        # Cache the result
-        if settings.enable_cache:
-            await cache.set(cache_key, result, 300)
-            logger.debug(f"Cached result for {cache_key}")
-        
-        return result
+            # Concurrent misses (e.g. a burst of check_model_exists calls)
+            # share a single /api/tags request
+            return await cache.get_or_set(MODELS_CACHE_KEY, fetch_models, 300)
+        return await fetch_models()
     except OllamaConnectionError as e:
         logger.error(f"Connection error in list_models: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except Exception as e:
         logger.exception("Unexpected error in list_models")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -117,24 +221,13 @@ async def show_model(name: str) -> Dict[str, Any]:
         return response
     except OllamaConnectionError as e:
         logger.error(f"Connection error in show_model: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in show_model: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except Exception as e:
         logger.exception("Unexpected error in show_model")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -147,21 +240,18 @@ async def generate_completion(
     seed: Optional[int] = None,
     num_predict: Optional[int] = None,
     stop: Optional[List[str]] = None,
-    stream: bool = False
+    stream: bool = False,
+    ctx: Optional[Context] = None
 ) -> Dict[str, Any]:
     """Generate a completion from a model with advanced options"""
     try:
         logger.debug(f"Generating completion with model: {model}")
         
         # Build options
-        options = GenerateOptions(
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k,
-            seed=seed,
-            num_predict=num_predict,
-            stop=stop
-        ).dict(exclude_none=True)
+        options = build_options(
+            temperature, top_p, top_k, seed, num_predict,
+            tuple(stop) if stop is not None else None
+        )
         
         request_data = {
             "model": model,
@@ -173,43 +263,45 @@ async def generate_completion(
             request_data["options"] = options
         
         if stream:
-            # For streaming, we'll collect all chunks and return the complete response
-            # In a real implementation, you might want to yield chunks
+            # Tools return a single result, so chunks are forwarded as progress
+            # notifications as they arrive and the full response is returned
             logger.info("Streaming response requested, collecting chunks...")
-            full_response = ""
+            parts: List[str] = []
             
-            async with await ollama_client.post("/api/generate", request_data, stream=True) as response:
-                async for line in response.aiter_lines():
-                    if line:
-                        import json
-                        chunk = json.loads(line)
-                        if "response" in chunk:
-                            full_response += chunk["response"]
-                        if chunk.get("done", False):
-                            # Return the final chunk with accumulated response
-                            chunk["response"] = full_response
-                            return chunk
+            chunks = ollama_client.stream_post("/api/generate", request_data)
+            try:
+                async for chunk in chunks:
+                    if "response" in chunk:
+                        parts.append(chunk["response"])
+                        await report_chunk(ctx, len(parts), chunk["response"])
+                    if chunk.get("done", False):
+                        # Return the final chunk with accumulated response
+                        chunk["response"] = "".join(parts)
+                        return chunk
+            finally:
+                # Release the pooled connection now rather than when the
+                # generator is garbage collected
+                await chunks.aclose()
         else:
-            response = await ollama_client.post(
-                "/api/generate",
-                request_data,
-                response_model=GenerateResponse
-            )
-            return response.dict()
+            async def generate() -> Dict[str, Any]:
+                response = await ollama_client.post(
+                    "/api/generate",
+                    request_data,
+                    response_model=GenerateResponse,
+                    trusted=True
+                )
+                return response.dict()
+            
+            cache_key = completion_cache_key("completion", request_data)
+            if cache_key is None:
+                return await generate()
+            return await cache.get_or_set(cache_key, generate, settings.completion_cache_ttl)
     except OllamaConnectionError as e:
         logger.error(f"Connection error in generate_completion: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in generate_completion: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except ValidationError as e:
         logger.error(f"Validation error in generate_completion: {e}")
         return {
@@ -218,10 +310,7 @@ async def generate_completion(
         }
     except Exception as e:
         logger.exception("Unexpected error in generate_completion")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -234,30 +323,32 @@ async def generate_chat_completion(
     seed: Optional[int] = None,
     num_predict: Optional[int] = None,
     stop: Optional[List[str]] = None,
-    stream: bool = False
+    stream: bool = False,
+    ctx: Optional[Context] = None
 ) -> Dict[str, Any]:
     """Generate a chat completion from a model with conversation history"""
     try:
         logger.debug(f"Generating chat completion with model: {model}")
         
-        # Validate messages
-        validated_messages = []
-        for msg in messages:
-            validated_messages.append(Message(**msg))
+        # Messages are already in wire format, so only check them here
+        errors = message_errors(messages)
+        if errors:
+            logger.error(f"Invalid messages in generate_chat_completion: {errors}")
+            # Same shape as ValidationError.errors() below
+            return {
+                "error": "Invalid parameters",
+                "details": errors
+            }
         
         # Build options
-        options = GenerateOptions(
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k,
-            seed=seed,
-            num_predict=num_predict,
-            stop=stop
-        ).dict(exclude_none=True)
+        options = build_options(
+            temperature, top_p, top_k, seed, num_predict,
+            tuple(stop) if stop is not None else None
+        )
         
         request_data = {
             "model": model,
-            "messages": [msg.dict() for msg in validated_messages],
+            "messages": messages,
             "stream": stream
         }
         
@@ -266,42 +357,43 @@ async def generate_chat_completion(
         
         if stream:
             logger.info("Streaming chat response requested, collecting chunks...")
-            full_response = ""
+            parts: List[str] = []
             role = None
             
-            async with await ollama_client.post("/api/chat", request_data, stream=True) as response:
-                async for line in response.aiter_lines():
-                    if line:
-                        import json
-                        chunk = json.loads(line)
-                        if "message" in chunk and "content" in chunk["message"]:
-                            full_response += chunk["message"]["content"]
-                            role = chunk["message"].get("role", "assistant")
-                        if chunk.get("done", False):
-                            # Return the final chunk with accumulated message
-                            chunk["message"] = {"role": role, "content": full_response}
-                            return chunk
+            chunks = ollama_client.stream_post("/api/chat", request_data)
+            try:
+                async for chunk in chunks:
+                    if "message" in chunk and "content" in chunk["message"]:
+                        parts.append(chunk["message"]["content"])
+                        role = chunk["message"].get("role", "assistant")
+                        await report_chunk(ctx, len(parts), chunk["message"]["content"])
+                    if chunk.get("done", False):
+                        # Return the final chunk with accumulated message
+                        chunk["message"] = {"role": role, "content": "".join(parts)}
+                        return chunk
+            finally:
+                # Release the pooled connection now rather than when the
+                # generator is garbage collected
+                await chunks.aclose()
         else:
-            response = await ollama_client.post(
-                "/api/chat",
-                request_data,
-                response_model=ChatResponse
-            )
-            return response.dict()
+            async def chat() -> Dict[str, Any]:
+                response = await ollama_client.post(
+                    "/api/chat",
+                    request_data,
+                    response_model=ChatResponse
+                )
+                return response.dict()
+            
+            cache_key = completion_cache_key("chat", request_data)
+            if cache_key is None:
+                return await chat()
+            return await cache.get_or_set(cache_key, chat, settings.completion_cache_ttl)
     except OllamaConnectionError as e:
         logger.error(f"Connection error in generate_chat_completion: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in generate_chat_completion: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except ValidationError as e:
         logger.error(f"Validation error in generate_chat_completion: {e}")
         return {
@@ -310,10 +402,7 @@ async def generate_chat_completion(
         }
     except Exception as e:
         logger.exception("Unexpected error in generate_chat_completion")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -327,22 +416,35 @@ async def generate_embeddings(
         
         # Handle both single strings and lists of strings
         if isinstance(prompt, list):
-            # Process each prompt separately since Ollama doesn't support batch requests
-            all_embeddings = []
-            for single_prompt in prompt:
+            # Process each prompt separately since Ollama doesn't support batch
+            # requests, but overlap them, bounded by embed_concurrency
+            semaphore = asyncio.Semaphore(settings.embed_concurrency)
+            
+            async def embed_one(single_prompt: str) -> List[List[float]]:
                 request_data = {
                     "model": model,
                     "prompt": single_prompt
                 }
                 
-                response = await ollama_client.post(
-                    "/api/embeddings",
-                    request_data,
-                    response_model=EmbeddingsResponse
-                )
-                
-                embeddings = response.get_embeddings()
-                all_embeddings.extend(embeddings)
+                async with semaphore:
+                    response = await ollama_client.post(
+                        "/api/embeddings",
+                        request_data,
+                        response_model=EmbeddingsResponse,
+                        trusted=True
+                    )
+                return response.get_embeddings()
+            
+            tasks = [asyncio.ensure_future(embed_one(p)) for p in prompt]
+            try:
+                # gather preserves prompt order
+                results = await asyncio.gather(*tasks)
+            except Exception:
+                # gather leaves the other requests running when one fails
+                for task in tasks:
+                    task.cancel()
+                raise
+            all_embeddings = [e for embeddings in results for e in embeddings]
             
             result = {
                 "model": model,
@@ -358,7 +460,8 @@ async def generate_embeddings(
             response = await ollama_client.post(
                 "/api/embeddings",
                 request_data,
-                response_model=EmbeddingsResponse
+                response_model=EmbeddingsResponse,
+                trusted=True
             )
             
             result = {
@@ -369,24 +472,13 @@ async def generate_embeddings(
         return result
     except OllamaConnectionError as e:
         logger.error(f"Connection error in generate_embeddings: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in generate_embeddings: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except Exception as e:
         logger.exception("Unexpected error in generate_embeddings")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -396,7 +488,7 @@ async def pull_model(name: str, insecure: bool = False) -> Dict[str, Any]:
         logger.info(f"Pulling model: {name}")
         
         # Clear model cache since we're adding a new model
-        await cache.delete("models:list_models")
+        await invalidate_model_cache()
         
         request_data = {
             "name": name,
@@ -408,17 +500,10 @@ async def pull_model(name: str, insecure: bool = False) -> Dict[str, Any]:
         return response
     except OllamaConnectionError as e:
         logger.error(f"Connection error in pull_model: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except Exception as e:
         logger.exception("Unexpected error in pull_model")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -428,7 +513,7 @@ async def copy_model(source: str, destination: str) -> Dict[str, Any]:
         logger.info(f"Copying model from {source} to {destination}")
         
         # Clear model cache since we're modifying models
-        await cache.delete("models:list_models")
+        await invalidate_model_cache()
         
         request_data = {
             "source": source,
@@ -439,24 +524,13 @@ async def copy_model(source: str, destination: str) -> Dict[str, Any]:
         return {"success": True, "message": f"Model copied from {source} to {destination}"}
     except OllamaConnectionError as e:
         logger.error(f"Connection error in copy_model: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in copy_model: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except Exception as e:
         logger.exception("Unexpected error in copy_model")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -466,30 +540,19 @@ async def delete_model(name: str) -> Dict[str, Any]:
         logger.warning(f"Deleting model: {name}")
         
         # Clear model cache since we're removing a model
-        await cache.delete("models:list_models")
+        await invalidate_model_cache()
         
         response = await ollama_client.delete("/api/delete", {"name": name})
         return {"success": True, "message": f"Model {name} deleted successfully"}
     except OllamaConnectionError as e:
         logger.error(f"Connection error in delete_model: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except OllamaAPIError as e:
         logger.error(f"API error in delete_model: {e}")
-        return {
-            "error": "Ollama API error",
-            "details": str(e),
-            "status_code": e.status_code
-        }
+        return api_error(e)
     except Exception as e:
         logger.exception("Unexpected error in delete_model")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
@@ -515,7 +578,7 @@ async def list_running_models() -> Dict[str, Any]:
                     "model": model.model,
                     "size": model.size,
                     "digest": model.digest,
-                    "expires_at": model.expires_at.isoformat()
+                    "expires_at": model.expires_at
                 }
                 for model in response.models
             ]
@@ -529,29 +592,28 @@ async def list_running_models() -> Dict[str, Any]:
         return result
     except OllamaConnectionError as e:
         logger.error(f"Connection error in list_running_models: {e}")
-        return {
-            "error": "Cannot connect to Ollama",
-            "details": str(e),
-            "suggestion": f"Ensure Ollama is running at {settings.ollama_host}"
-        }
+        return connection_error(e)
     except Exception as e:
         logger.exception("Unexpected error in list_running_models")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
 
 
 @mcp.tool()
 async def check_model_exists(name: str) -> Dict[str, Any]:
     """Check if a model exists locally"""
     try:
-        models_response = await list_models()
+        model_names = None
+        if settings.enable_cache:
+            model_names = await cache.get(MODEL_NAMES_CACHE_KEY)
         
-        if "error" in models_response:
-            return models_response
+        if model_names is None:
+            models_response = await list_models()
+            
+            if "error" in models_response:
+                return models_response
+            
+            model_names = frozenset(m["name"] for m in models_response["models"])
         
-        model_names = [m["name"] for m in models_response["models"]]
         exists = name in model_names
         
         return {
@@ -561,13 +623,24 @@ async def check_model_exists(name: str) -> Dict[str, Any]:
         }
     except Exception as e:
         logger.exception("Unexpected error in check_model_exists")
-        return {
-            "error": "Internal server error",
-            "details": str(e)
-        }
+        return internal_error(e)
+
+
+def install_uvloop() -> None:
+    """Use uvloop as the asyncio event loop when it is available"""
+    if sys.platform == "win32":
+        return
+    try:
+        import uvloop
+    except ImportError:
+        return
+    uvloop.install()
+    logger.debug("Using uvloop event loop")
 
 
 if __name__ == "__main__":
+    install_uvloop()
+    
     # Run the MCP server
     logger.info(f"Starting Ollama MCP Server with log level: {settings.log_level}")
     logger.info(f"Ollama host: {settings.ollama_host}")
@@ -1,8 +1,24 @@
 """Pydantic models for Ollama API requests and responses"""
-from typing import List, Dict, Any, Optional, Union
-from pydantic import BaseModel, Field, field_validator
+from functools import lru_cache
+from inspect import isclass
+from typing import List, Dict, Any, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 from datetime import datetime
 
+M = TypeVar("M", bound=BaseModel)
+
+
+_datetime_adapter = TypeAdapter(datetime)
+
+
+@lru_cache(maxsize=8192)
+def _parse_iso(v: str) -> datetime:
+    """Parse an ISO 8601 timestamp as sent by Ollama"""
+    # pydantic-core's parser accepts the trailing Z and nanosecond
+    # precision Ollama sends, which fromisoformat only does from 3.11.
+    # Timestamps repeat across polls, so the cache hits almost every time
+    return _datetime_adapter.validate_python(v)
+
 
 class Message(BaseModel):
     """Chat message"""
@@ -37,13 +53,6 @@ class ModelInfo(BaseModel):
     modified_at: Optional[datetime] = None
     size: Optional[int] = None
     digest: Optional[str] = None
-    
-    @field_validator("modified_at", mode="before")
-    @classmethod
-    def parse_datetime(cls, v):
-        if isinstance(v, str):
-            return datetime.fromisoformat(v.replace("Z", "+00:00"))
-        return v
 
 
 class ModelDetails(BaseModel):
@@ -89,13 +98,6 @@ class GenerateResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
-    
-    @field_validator("created_at", mode="before")
-    @classmethod
-    def parse_datetime(cls, v):
-        if isinstance(v, str):
-            return datetime.fromisoformat(v.replace("Z", "+00:00"))
-        return v
 
 
 class ChatResponse(BaseModel):
@@ -110,13 +112,6 @@ class ChatResponse(BaseModel):
     prompt_eval_duration: Optional[int] = None
     eval_count: Optional[int] = None
     eval_duration: Optional[int] = None
-    
-    @field_validator("created_at", mode="before")
-    @classmethod
-    def parse_datetime(cls, v):
-        if isinstance(v, str):
-            return datetime.fromisoformat(v.replace("Z", "+00:00"))
-        return v
 
 
 class EmbeddingsResponse(BaseModel):
@@ -147,13 +142,6 @@ class ProcessModel(BaseModel):
     size: int
     digest: str
     expires_at: datetime
-    
-    @field_validator("expires_at", mode="before")
-    @classmethod
-    def parse_datetime(cls, v):
-        if isinstance(v, str):
-            return datetime.fromisoformat(v.replace("Z", "+00:00"))
-        return v
 
 
 class ProcessListResponse(BaseModel):
@@ -164,4 +152,52 @@ class ProcessListResponse(BaseModel):
 class ErrorResponse(BaseModel):
     """Error response from Ollama API"""
     error: str
-    details: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    details: Optional[Dict[str, Any]] = None
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    """Strip Optional[...] from a field annotation"""
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _is_model(annotation: Any) -> bool:
+    return isclass(annotation) and issubclass(annotation, BaseModel)
+
+
+@lru_cache(maxsize=None)
+def _construct_plan(model: Type[BaseModel]) -> Tuple[Tuple[str, str, Any], ...]:
+    """Fields of a model that need conversion before model_construct"""
+    plan = []
+    for name, field in model.model_fields.items():
+        annotation = _unwrap_optional(field.annotation)
+        if annotation is datetime:
+            plan.append((name, "datetime", None))
+        elif _is_model(annotation):
+            plan.append((name, "model", annotation))
+        elif get_origin(annotation) is list and _is_model(get_args(annotation)[0]):
+            plan.append((name, "models", get_args(annotation)[0]))
+    return tuple(plan)
+
+
+def construct_trusted(model: Type[M], data: Dict[str, Any]) -> M:
+    """
+    Build a model from trusted Ollama response data without validation.
+    Nested models are constructed recursively and timestamps parsed, since
+    model_construct skips the field validators that normally do this.
+    """
+    for name, kind, submodel in _construct_plan(model):
+        value = data.get(name)
+        if value is None:
+            continue
+        if kind == "datetime":
+            if isinstance(value, str):
+                data[name] = _parse_iso(value)
+        elif kind == "model":
+            data[name] = construct_trusted(submodel, value)
+        else:
+            data[name] = [construct_trusted(submodel, item) for item in value]
+    return model.model_construct(**data)
@@ -0,0 +1,91 @@
+"""Tests for the single-flight behaviour of SimpleCache.get_or_set"""
+import asyncio
+import unittest
+
+from ollama_mcp_server.cache import SimpleCache
+
+
+class GetOrSetTest(unittest.TestCase):
+    """Concurrent callers of get_or_set share one factory call"""
+
+    def test_concurrent_misses_share_one_call(self):
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def run():
+            cache = SimpleCache(maxsize=8)
+            results = await asyncio.gather(
+                *(cache.get_or_set("key", factory, 60) for _ in range(5))
+            )
+            self.assertEqual(results, ["value"] * 5)
+            self.assertEqual(await cache.get("key"), "value")
+
+        asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+
+    def test_exception_reaches_every_caller(self):
+        async def factory():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            cache = SimpleCache(maxsize=8)
+            results = await asyncio.gather(
+                *(cache.get_or_set("key", factory, 60) for _ in range(3)),
+                return_exceptions=True
+            )
+            for result in results:
+                self.assertIsInstance(result, ValueError)
+            self.assertIsNone(await cache.get("key"))
+            self.assertEqual(await cache.get_or_set("key", _value("again"), 60), "again")
+
+        asyncio.run(run())
+
+    def test_cancelled_first_caller_does_not_fail_others(self):
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def run():
+            cache = SimpleCache(maxsize=8)
+            first = asyncio.ensure_future(cache.get_or_set("key", factory, 60))
+            await asyncio.sleep(0)
+            others = [
+                asyncio.ensure_future(cache.get_or_set("key", factory, 60))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0)
+            first.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            self.assertEqual(await asyncio.gather(*others), ["value"] * 3)
+            self.assertEqual(await cache.get("key"), "value")
+
+        asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+
+    def test_cached_value_skips_factory(self):
+        async def run():
+            cache = SimpleCache(maxsize=8)
+            await cache.set("key", "cached", 60)
+            return await cache.get_or_set("key", _value("fresh"), 60)
+
+        self.assertEqual(asyncio.run(run()), "cached")
+
+
+def _value(value):
+    async def factory():
+        return value
+    return factory
+
+
+if __name__ == "__main__":
+    unittest.main()